@@ -22,19 +22,35 @@ Observações:
 """
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
 import io
+import math
+import multiprocessing
 import os
+import pickle
+import sys
 import tempfile
-from typing import List, Optional, Literal
-
-import litellm
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Literal, Union
+from urllib.parse import quote
+
+import anyio
+import httpx
+import orjson
+from cachetools import TTLCache
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Body
-from pydantic import BaseModel, AnyHttpUrl
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, AnyHttpUrl, ConfigDict
 
 # --- MarkItDown --------------------------------------------------------------
 
 try:
-    from markitdown import MarkItDown
+    from markitdown import MarkItDown, StreamInfo
 except Exception as e:
     raise RuntimeError(
         "markitdown não está instalado. Execute: pip install 'markitdown[all]'"
@@ -43,8 +59,133 @@ except Exception as e:
 
 # --- LLM opcional ------------------------------------------------------------
 
-# Instância global do conversor. Será configurada via API.
-md = MarkItDown()
+# Conversor de cada processo do pool, construído em _init_worker (o llm_client
+# não é picklable). No processo da API fica None: ele nunca converte.
+md: Optional[MarkItDown] = None
+
+# --- Pool de processos -------------------------------------------------------
+
+# As conversões (PDF, OCR, parsing) são CPU-bound e seguram o GIL; rodam num
+# pool de processos para obter paralelismo real entre núcleos. O tamanho é
+# limitado para não sobrecarregar a máquina quando o MarkItDown usa threads,
+# e por padrão os núcleos são divididos entre os workers do uvicorn.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+MD_WORKERS = max(1, int(os.getenv("MD_WORKERS", (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+
+
+def _llm_config_from_env() -> Optional[dict]:
+    """Configuração inicial do LLM via MD_LLM_PROVIDER/MD_LLM_API_KEY/MD_LLM_MODEL."""
+    api_key = os.getenv("MD_LLM_API_KEY")
+    model = os.getenv("MD_LLM_MODEL")
+    if not api_key or not model:
+        return None
+    return {
+        "provider": os.getenv("MD_LLM_PROVIDER", "openai"),
+        "api_key": api_key,
+        "model": model,
+    }
+
+
+def _init_worker(llm_config: Optional[dict]) -> None:
+    """Constrói o MarkItDown do processo worker, com o LLM se configurado."""
+    global md
+    if llm_config:
+        client = LiteLLMClient(**llm_config)
+        md = MarkItDown(llm_client=client, llm_model=client.model_name)
+    else:
+        md = MarkItDown()
+
+
+def _make_pool(llm_config: Optional[dict]) -> concurrent.futures.ProcessPoolExecutor:
+    # "spawn" evita herdar via fork as threads do servidor (event loop, threadpool).
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=MD_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(llm_config,),
+    )
+
+
+def _call_in_worker(fn, *args):
+    """Executa `fn` no worker garantindo que a exceção volte ao processo da API.
+
+    Exceções do MarkItDown guardam tracebacks e não são picklable; sem isto o
+    cliente receberia só "cannot pickle 'traceback' object".
+    """
+    try:
+        return fn(*args)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            raise RuntimeError(str(e)) from None
+        raise
+
+def _worker_ready() -> bool:
+    """Tarefa vazia: só confirma que o initializer do worker funcionou."""
+    return md is not None
+
+
+# Configuração de LLM em vigor; é com ela que os workers do pool são criados.
+LLM_CONFIG: Optional[dict] = _llm_config_from_env()
+
+# Criado no lifespan do app, não no import: os workers "spawn" reimportam este
+# módulo e não devem construir um pool próprio.
+PROC_POOL: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+# Limita as conversões submetidas ao pool. Excedido o limite, os endpoints de
+# arquivo único respondem 429 após MD_QUEUE_TIMEOUT segundos em vez de
+# enfileirar sem limite; os lotes aguardam a vez.
+MD_CONCURRENCY = max(1, int(os.getenv("MD_CONCURRENCY", MD_WORKERS)))
+MD_QUEUE_TIMEOUT = float(os.getenv("MD_QUEUE_TIMEOUT", 5))
+CONVERT_SEM = asyncio.Semaphore(MD_CONCURRENCY)
+
+# Limita as conversões em voo dos lotes (/convert/files, /convert/zip) para não
+# acumular arquivos temporários além do que o pool consegue consumir.
+BATCH_SEM = asyncio.Semaphore(MD_WORKERS * 2)
+
+# Cache das conversões de URL: as mesmas páginas/vídeos são pedidos
+# repetidamente e cada acerto evita um download + parsing. O limite é pela
+# memória ocupada pelo markdown, não pelo número de URLs: uma transcrição ou
+# PDF longo pesa o que ocupa (sys.getsizeof conta 1 a 4 bytes por caractere,
+# conforme o texto tenha CJK/emoji).
+URL_CACHE: TTLCache = TTLCache(
+    maxsize=int(os.getenv("MD_URL_CACHE_BYTES", 64 * 1024 * 1024)),
+    ttl=int(os.getenv("MD_URL_CACHE_TTL", 3600)),
+    getsizeof=lambda out: sys.getsizeof(out.markdown),
+)
+# Conversões de URL em andamento, para que pedidos simultâneos da mesma URL
+# aguardem uma única conversão em vez de repeti-la.
+_url_inflight: Dict[str, asyncio.Future] = {}
+
+# Tamanho dos blocos lidos de um upload ao salvá-lo em disco.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Acima deste tamanho o Starlette já mantém o upload num arquivo em disco
+# (spool_max_size); no Linux ele é copiado pelo kernel com sendfile(2).
+SENDFILE_THRESHOLD = 1024 * 1024
+
+# Uploads até este tamanho seguem ao worker em memória (BytesIO); maiores são
+# salvos em disco e o worker recebe só o caminho, sem copiar o corpo no pickle.
+INLINE_UPLOAD_MAX = SENDFILE_THRESHOLD
+
+# Máximo de entradas do ZIP convertidas por tarefa do pool: amortiza a abertura
+# do ZIP sem segurar muitas entradas prontas atrás de uma lenta.
+ZIP_BATCH_MAX = 8
+
+# Referências fortes às tarefas de limpeza em segundo plano (o event loop só
+# guarda referências fracas).
+_background_tasks: set = set()
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    global PROC_POOL
+    PROC_POOL = _make_pool(LLM_CONFIG)
+    try:
+        yield
+    finally:
+        PROC_POOL.shutdown(wait=False, cancel_futures=True)
 
 
 # --- FastAPI -----------------------------------------------------------------
@@ -56,27 +197,41 @@ app = FastAPI(
         "Retorno padrão: JSON {markdown, bytes, metadata}. Acrescente ?download=1 para baixar .md."
     ),
     version="1.0.0",
+    lifespan=_lifespan,
 )
 
+# Markdown de PDFs/planilhas chega a vários MB e comprime bem; só vale a pena
+# acima de 1 KiB. O Starlette (>= 1.6) comprime o streaming com Z_SYNC_FLUSH
+# por bloco, então cada linha NDJSON chega ao cliente assim que é produzida, e
+# blocos grandes são comprimidos numa thread, fora do event loop.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # ----------------------------------------------------------------------------
 # Modelos de entrada/saída
 # ----------------------------------------------------------------------------
 
-class LlmConfigIn(BaseModel):
+class _InputModel(BaseModel):
+    # Entradas imutáveis e estritas: campos desconhecidos são rejeitados
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+class LlmConfigIn(_InputModel):
     provider: Literal["openai", "gemini", "groq", "claude"] = "openai"
     api_key: str
     model: str
 
-class ConvertUrlIn(BaseModel):
+class ConvertUrlIn(_InputModel):
     url: AnyHttpUrl
 
-class ConvertTextIn(BaseModel):
+class ConvertTextIn(_InputModel):
     html: Optional[str] = None
     csv: Optional[str] = None
     json_text: Optional[str] = None
     xml: Optional[str] = None
 
-class MarkdownOut(BaseModel):
+# Só de saída: dataclass sem validação na construção; o FastAPI a serializa
+# pelo response_model e o orjson direto nas linhas NDJSON
+@dataclasses.dataclass(slots=True)
+class MarkdownOut:
     markdown: str
     source: Optional[str] = None
     filename: Optional[str] = None
@@ -87,31 +242,269 @@ class MarkdownOut(BaseModel):
 # Helpers
 # ----------------------------------------------------------------------------
 
-def _convert_to_markdown_from_path(path: str) -> MarkdownOut:
-    result = md.convert(path)
-    text = getattr(result, "text_content", None) or str(result)
+def _result_text(result) -> str:
+    # DocumentConverterResult sempre tem text_content; str() só como reserva
+    try:
+        return result.text_content
+    except AttributeError:
+        return str(result)
+
+def _file_suffix(name: Optional[str]) -> str:
+    """Extensão de `name` com o ponto, como os.path.splitext(name)[1], sem o custo do os.path."""
+    if not name:
+        return ""
+    i = name.rfind(".")
+    # Sem ponto, ou ponto num diretório/no início do nome (".bashrc")
+    if i <= name.rfind("/") + 1:
+        return ""
+    return name[i:]
+
+def _convert_to_markdown_from_stream(
+    buf: BinaryIO, filename: Optional[str], suffix: str, size: Optional[int] = None
+) -> MarkdownOut:
     # Metadados best-effort
-    size = os.path.getsize(path) if os.path.exists(path) else None
+    if size is None:
+        size = buf.seek(0, io.SEEK_END)
+        buf.seek(0)
+    # O nome original também entra na detecção do tipo, como no md.convert(path)
+    result = md.convert_stream(buf, stream_info=StreamInfo(extension=suffix or None, filename=filename))
+    text = _result_text(result)
     return MarkdownOut(
         markdown=text,
         source="file",
-        filename=os.path.basename(path),
+        filename=filename,
         bytes=size,
         content_type=None,
     )
 
-def _save_upload_to_temp(upload: UploadFile) -> str:
+def _convert_to_markdown_from_path(path: str, filename: Optional[str], suffix: str) -> MarkdownOut:
+    with open(path, "rb") as fp:
+        return _convert_to_markdown_from_stream(fp, filename, suffix, os.fstat(fp.fileno()).st_size)
+
+def _convert_zip_entries(zip_path: str, names: List[str]) -> List[dict]:
+    """Converte um lote de entradas lendo-as direto do ZIP, sem extraí-las para
+    memória ou disco. O ZIP (e seu diretório central) é aberto uma vez por lote;
+    a falha de uma entrada vira linha de erro sem afetar as demais.
+    """
+    lines = []
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        for name in names:
+            try:
+                with z.open(name) as fp:
+                    out = _convert_to_markdown_from_stream(
+                        fp, name, _file_suffix(name), z.getinfo(name).file_size
+                    )
+                lines.append({"filename": name, "markdown": out.markdown})
+            except Exception as e:
+                lines.append({"filename": name, "error": str(e)})
+    return lines
+
+def _convert_to_markdown_from_url(url: str) -> MarkdownOut:
+    result = md.convert(url)
+    text = _result_text(result)
+    return MarkdownOut(
+        markdown=text,
+        source=url,
+        filename=None,
+        bytes=None,
+        content_type=None,
+    )
+
+def _replace_broken_pool(broken: concurrent.futures.ProcessPoolExecutor) -> None:
+    """Troca o pool quebrado (worker morto por OOM, crash nativo...) por um novo."""
+    global PROC_POOL
+    if PROC_POOL is broken:
+        PROC_POOL = _make_pool(LLM_CONFIG)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+def _release_slot_on(loop: asyncio.AbstractEventLoop):
+    """Callback de concurrent.futures que devolve a vaga de CONVERT_SEM no loop."""
+    def _release(_) -> None:
+        try:
+            loop.call_soon_threadsafe(CONVERT_SEM.release)
+        except RuntimeError:
+            pass  # loop já encerrado (shutdown)
+    return _release
+
+async def _run_in_pool(fn, *args, wait: Optional[float] = None):
+    """Executa `fn(*args)` no pool de processos sem bloquear o event loop.
+
+    Com `wait`, desiste com 429 se não houver vaga em CONVERT_SEM nesse prazo.
+    Se um worker morrer, o pool é recriado: um pool que já estava quebrado é
+    trocado e a tarefa reenviada; se quebrar durante a tarefa, responde 503
+    sem reexecutá-la (ela pode ter sido a causa).
+    """
+    try:
+        await asyncio.wait_for(CONVERT_SEM.acquire(), wait)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=429, detail="Servidor ocupado, tente novamente.")
+    loop = asyncio.get_running_loop()
+    pool = PROC_POOL
+    try:
+        try:
+            cf = pool.submit(_call_in_worker, fn, *args)
+        except BrokenProcessPool:
+            _replace_broken_pool(pool)
+            pool = PROC_POOL
+            cf = pool.submit(_call_in_worker, fn, *args)
+    except BaseException:
+        CONVERT_SEM.release()
+        raise
+    # A vaga só volta quando o worker termina: se quem espera for cancelado
+    # (cliente desconectou), a conversão continua ocupando o pool e a vaga.
+    cf.add_done_callback(_release_slot_on(loop))
+    try:
+        return await asyncio.wrap_future(cf)
+    except BrokenProcessPool:
+        _replace_broken_pool(pool)
+        raise HTTPException(status_code=503, detail="Worker de conversão falhou, tente novamente.")
+
+async def _convert_url_cached(url: str, wait: Optional[float] = None) -> MarkdownOut:
+    out = URL_CACHE.get(url)
+    if out is not None:
+        return out
+    fut = _url_inflight.get(url)
+    if fut is None:
+        fut = asyncio.ensure_future(_run_in_pool(_convert_to_markdown_from_url, url, wait=wait))
+        _url_inflight[url] = fut
+
+        def _done(f: asyncio.Future) -> None:
+            # Se o LLM foi reconfigurado no meio, o resultado não vai ao cache
+            if _url_inflight.get(url) is not f:
+                return
+            del _url_inflight[url]
+            if not f.cancelled() and f.exception() is None:
+                out = f.result()
+                # Maior que o cache inteiro: o TTLCache recusaria com ValueError
+                if URL_CACHE.getsizeof(out) <= URL_CACHE.maxsize:
+                    URL_CACHE[url] = out
+
+        fut.add_done_callback(_done)
+    # shield: um cliente que desconecta não cancela a conversão dos demais
+    return await asyncio.shield(fut)
+
+def _sendfile_all(src: BinaryIO, dst_fd: int, size: int) -> None:
+    """Copia `size` bytes de `src` para `dst_fd` sem passar pelo espaço de usuário."""
+    src.flush()
+    src_fd = src.fileno()
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+async def _save_upload_to_temp(upload: UploadFile) -> str:
     suffix = f"_{upload.filename}" if upload.filename else ""
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        data = upload.file.read()
-        tmp.write(data)
-        tmp.flush()
+        if sys.platform.startswith("linux") and (upload.size or 0) > SENDFILE_THRESHOLD:
+            await anyio.to_thread.run_sync(_sendfile_all, upload.file, tmp.fileno(), upload.size)
+        else:
+            # Copia em blocos: o pico de memória fica em UPLOAD_CHUNK_SIZE, não no
+            # tamanho do arquivo. A escrita roda numa thread para não bloquear o loop.
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                await anyio.to_thread.run_sync(tmp.write, chunk)
         return tmp.name
 
+@contextlib.asynccontextmanager
+async def _staged_upload(upload: UploadFile) -> AsyncIterator[str]:
+    """Salva o upload num temporário e o remove ao sair do contexto."""
+    path = await _save_upload_to_temp(upload)
+    try:
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+async def _close_when_done(stack: contextlib.AsyncExitStack, tasks: List[asyncio.Task]) -> None:
+    async with stack:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _release_when_done(stack: contextlib.AsyncExitStack, tasks: List[asyncio.Task]) -> None:
+    """Fecha `stack` quando todas as tarefas terminarem (ou forem canceladas),
+    mesmo que o cliente nunca consuma a resposta."""
+    release = asyncio.create_task(_close_when_done(stack, tasks))
+    _background_tasks.add(release)
+    release.add_done_callback(_background_tasks.discard)
+
+async def _convert_upload(upload: UploadFile, wait: Optional[float] = None) -> MarkdownOut:
+    """Converte o upload no pool: em memória se pequeno, senão via arquivo temporário."""
+    suffix = _file_suffix(upload.filename)
+    if upload.size is not None and upload.size <= INLINE_UPLOAD_MAX:
+        buf = io.BytesIO(await upload.read())
+        return await _run_in_pool(
+            _convert_to_markdown_from_stream, buf, upload.filename, suffix, wait=wait
+        )
+    async with _staged_upload(upload) as path:
+        return await _run_in_pool(
+            _convert_to_markdown_from_path, path, upload.filename, suffix, wait=wait
+        )
+
+async def _convert_upload_in_batch(upload: UploadFile) -> MarkdownOut:
+    async with BATCH_SEM:
+        return await _convert_upload(upload)
+
+async def _convert_path_to_lines(path: str, filename: Optional[str]) -> List[Union[MarkdownOut, dict]]:
+    """Converte um upload já salvo em disco e devolve sua linha NDJSON."""
+    try:
+        async with BATCH_SEM:
+            return [await _run_in_pool(
+                _convert_to_markdown_from_path, path, filename, _file_suffix(filename)
+            )]
+    except Exception as e:
+        return [{"filename": filename, "error": str(e)}]
+
+async def _convert_zip_batch(zip_path: str, names: List[str]) -> List[dict]:
+    """Converte um lote de entradas do ZIP no pool; o worker as lê direto do arquivo."""
+    try:
+        async with BATCH_SEM:
+            return await _run_in_pool(_convert_zip_entries, zip_path, names)
+    except Exception as e:
+        # Falha do pool (fila cheia, worker morto): o lote inteiro vira erro
+        return [{"filename": name, "error": str(e)} for name in names]
+
+def _markdown_download(markdown: str, filename: str) -> Response:
+    """Devolve o markdown como anexo .md direto da memória, sem tocar o disco."""
+    # Mesmo cabeçalho que o FileResponse gera, incluindo nomes não-ASCII (RFC 5987)
+    quoted = quote(filename)
+    if quoted != filename:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    return Response(
+        markdown.encode("utf-8"),
+        media_type="text/markdown",
+        headers={"Content-Disposition": disposition},
+    )
+
+async def _iter_ndjson(tasks: List[asyncio.Task]) -> AsyncIterator[bytes]:
+    """Emite as linhas NDJSON de cada tarefa (uma por item da lista que ela
+    devolve), na ordem em que as tarefas terminam."""
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield b"".join(
+                orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in await fut
+            )
+    finally:
+        # Cliente desconectou: não converte o que ainda está na fila
+        for task in tasks:
+            task.cancel()
+
 # ----------------------------------------------------------------------------
 # Endpoints
 # ----------------------------------------------------------------------------
 
+def _llm_http_session() -> httpx.Client:
+    """Sessão HTTP compartilhada: TCP + TLS reaproveitados entre chamadas ao LLM."""
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    try:
+        return httpx.Client(http2=True, limits=limits)
+    except ImportError:
+        # Pacote h2 ausente: fica no HTTP/1.1 em vez de derrubar a conversão
+        return httpx.Client(limits=limits)
+
 class LiteLLMClient:
     def __init__(self, api_key, model, provider):
         self.api_key = api_key
@@ -124,25 +517,57 @@ class LiteLLMClient:
         elif self.provider == "groq":
             self.model_name = f"groq/{self.model}"
 
+        # Montado uma vez: um PDF pode disparar dezenas de chamadas (OCR/imagens)
+        self._base_kwargs = {"model": self.model_name, "api_key": self.api_key}
+
+    # O MarkItDown chama client.chat.completions.create(...)
+    @property
     def chat(self):
         return self
 
+    @property
     def completions(self):
         return self
 
     def create(self, *args, **kwargs):
-        kwargs['model'] = self.model_name
-        kwargs['messages'] = kwargs.get('messages')
-        kwargs['api_key'] = self.api_key
+        # Importado só aqui: o import do litellm leva segundos (e busca o mapa de
+        # custos na rede), o que atrasaria cada worker criado, mesmo sem LLM.
+        import litellm
+
+        # Sessão criada na primeira chamada, no processo que converte; uma falha
+        # aqui afeta só esta conversão, não o initializer do pool.
+        if litellm.client_session is None:
+            litellm.client_session = _llm_http_session()
+        kwargs.update(self._base_kwargs)
         return litellm.completion(*args, **kwargs)
 
 @app.post("/config/llm")
-def configure_llm(config: LlmConfigIn):
-    """Configura o cliente LLM para o MarkItDown."""
+async def configure_llm(config: LlmConfigIn):
+    """Configura o cliente LLM para o MarkItDown.
+
+    Roda no event loop (não no threadpool): a troca do pool não tem `await`,
+    então é atômica em relação às submissões feitas por _run_in_pool. Se o
+    worker não inicializar com a nova configuração, responde 400 e mantém a atual.
+    """
     try:
-        global md
-        md.llm_client = LiteLLMClient(api_key=config.api_key, model=config.model, provider=config.provider)
-        md.llm_model = md.llm_client.model_name
+        global LLM_CONFIG, PROC_POOL
+        # Os workers constroem o cliente no initializer; o novo pool só entra
+        # em uso depois que um worker inicializou com sucesso.
+        llm_config = config.model_dump()
+        new_pool = _make_pool(llm_config)
+        try:
+            await asyncio.wrap_future(new_pool.submit(_worker_ready))
+        except BaseException:
+            new_pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        # Sem `await` daqui em diante: a troca é atômica em relação às
+        # submissões, e o pool antigo termina as conversões em andamento.
+        LLM_CONFIG = llm_config
+        old_pool, PROC_POOL = PROC_POOL, new_pool
+        old_pool.shutdown(wait=False)
+        # Conversões anteriores foram feitas com outra configuração de LLM
+        URL_CACHE.clear()
+        _url_inflight.clear()
         return {"status": "ok", "message": f"LLM provider '{config.provider}' configured."}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to configure LLM: {e}")
@@ -170,53 +595,43 @@ async def convert_file(
     download: bool = Query(False, description="Se true, baixa um .md"),
 ):
     try:
-        temp_path = _save_upload_to_temp(file)
-        out = _convert_to_markdown_from_path(temp_path)
+        out = await _convert_upload(file, wait=MD_QUEUE_TIMEOUT)
         if download:
-            # Salva em .md temporário para devolver como arquivo
-            md_path = tempfile.mktemp(suffix=".md")
-            with open(md_path, "w", encoding="utf-8") as f:
-                f.write(out.markdown)
-            return FileResponse(
-                md_path,
-                media_type="text/markdown",
-                filename=(file.filename or "output") + ".md"
-            )
+            return _markdown_download(out.markdown, (file.filename or "output") + ".md")
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        try:
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                os.unlink(temp_path)
-        except Exception:
-            pass
 
 @app.post("/convert/files")
 async def convert_multiple_files(
     files: List[UploadFile] = File(...),
     as_ndjson: bool = Query(False, description="Se true, retorna NDJSON (1 linha por arquivo)."),
 ):
-    results: List[MarkdownOut] = []
-    lines: List[str] = []
-    for f in files:
-        temp_path = _save_upload_to_temp(f)
-        try:
-            out = _convert_to_markdown_from_path(temp_path)
-            results.append(out)
-            if as_ndjson:
-                import json
-                lines.append(json.dumps(out.model_dump(), ensure_ascii=False))
-        finally:
-            try:
-                os.unlink(temp_path)
-            except Exception:
-                pass
-
     if as_ndjson:
-        payload = "\n".join(lines)
-        return PlainTextResponse(payload, media_type="application/x-ndjson")
-    return {"items": [r.model_dump() for r in results]}
+        # Os uploads são fechados quando o handler retorna: salva-os em disco
+        # antes (memória limitada ao bloco de cópia) e transmite cada linha
+        # assim que sua conversão termina.
+        async with contextlib.AsyncExitStack() as stack:
+            staged = [(await stack.enter_async_context(_staged_upload(f)), f.filename) for f in files]
+            # Os temporários precisam sobreviver ao handler: a remoção passa às conversões
+            cleanup = stack.pop_all()
+        tasks = [asyncio.create_task(_convert_path_to_lines(path, name)) for path, name in staged]
+        _release_when_done(cleanup, tasks)
+        return StreamingResponse(_iter_ndjson(tasks), media_type="application/x-ndjson")
+
+    # Arquivos independentes: converte todos em paralelo no pool. O TaskGroup
+    # cancela as demais conversões assim que uma falha.
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(_convert_upload_in_batch(f)) for f in files]
+    except ExceptionGroup as eg:
+        e = eg.exceptions[0]
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [t.result() for t in tasks]}
 
 @app.post("/convert/url", response_model=MarkdownOut)
 async def convert_url(
@@ -224,29 +639,20 @@ async def convert_url(
     download: bool = Query(False),
 ):
     try:
-        result = md.convert(request.url)
-        text = getattr(result, "text_content", None) or str(result)
-        out = MarkdownOut(
-            markdown=text,
-            source=str(request.url),
-            filename=None,
-            bytes=None,
-            content_type=None,
-        )
+        out = await _convert_url_cached(str(request.url), wait=MD_QUEUE_TIMEOUT)
         if download:
-            md_path = tempfile.mktemp(suffix="_url.md")
-            with open(md_path, "w", encoding="utf-8") as f:
-                f.write(out.markdown)
-            return FileResponse(md_path, media_type="text/markdown", filename="converted.md")
+            return _markdown_download(out.markdown, "converted.md")
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/convert/text", response_model=MarkdownOut)
 async def convert_raw_text(payload: ConvertTextIn):
     """Converte strings cruas de HTML/CSV/JSON/XML em Markdown.
-    Obs.: o MarkItDown opera nativamente sobre arquivos/URLs; aqui salvamos
-    o conteúdo temporariamente para obter conversão consistente.
+    Obs.: o conteúdo é entregue ao MarkItDown como stream, com a extensão
+    indicando o formato para obter conversão consistente.
     """
     if not any([payload.html, payload.csv, payload.json_text, payload.xml]):
         raise HTTPException(400, detail="Envie ao menos um dos campos: html, csv, json_text ou xml")
@@ -265,63 +671,44 @@ async def convert_raw_text(payload: ConvertTextIn):
             suffix = ".xml"
             content = payload.xml.encode("utf-8")
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(content)
-            tmp.flush()
-            temp_path = tmp.name
-
-        out = _convert_to_markdown_from_path(temp_path)
+        buf = io.BytesIO(content)
+        out = await _run_in_pool(
+            _convert_to_markdown_from_stream, buf, None, suffix, wait=MD_QUEUE_TIMEOUT
+        )
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        try:
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                os.unlink(temp_path)
-        except Exception:
-            pass
 
 @app.post("/convert/zip")
 async def convert_zip(file: UploadFile = File(...)):
     """Recebe um .zip e converte cada arquivo interno em Markdown, retornando NDJSON.
-    Cada linha é um objeto com {filename, markdown}.
+    Cada linha é um objeto com {filename, markdown} (ou {filename, error}),
+    emitida assim que a conversão da entrada termina.
     """
-    import zipfile, json
-
-    temp_zip = _save_upload_to_temp(file)
-    lines: List[str] = []
-    try:
-        with zipfile.ZipFile(temp_zip, 'r') as z:
-            names = [n for n in z.namelist() if not n.endswith('/')]  # ignora pastas
-            for name in names:
-                with z.open(name) as f:
-                    # Salva cada entrada como arquivo temporário e converte
-                    suffix = os.path.splitext(name)[1] or ""
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                        tmp.write(f.read())
-                        tmp.flush()
-                        path = tmp.name
-                    try:
-                        out = _convert_to_markdown_from_path(path)
-                        lines.append(json.dumps({
-                            "filename": name,
-                            "markdown": out.markdown,
-                        }, ensure_ascii=False))
-                    finally:
-                        try:
-                            os.unlink(path)
-                        except Exception:
-                            pass
-        payload = "\n".join(lines)
-        return PlainTextResponse(payload, media_type="application/x-ndjson")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    finally:
+    async with contextlib.AsyncExitStack() as stack:
+        temp_zip = await stack.enter_async_context(_staged_upload(file))
         try:
-            if os.path.exists(temp_zip):
-                os.unlink(temp_zip)
-        except Exception:
-            pass
+            with zipfile.ZipFile(temp_zip, 'r') as z:
+                names = [info.filename for info in z.infolist() if not info.is_dir()]
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # O ZIP precisa sobreviver ao handler: a remoção passa às conversões
+        staged = stack.pop_all()
+
+    # As entradas são descompactadas pelos próprios workers à medida que o pool
+    # libera vagas, sem cópias intermediárias no processo da API. Vão em lotes
+    # (~4 por worker) para não reabrir o ZIP a cada entrada, mas pequenos: um
+    # lote só é emitido quando termina inteiro.
+    batch = min(max(1, math.ceil(len(names) / (MD_WORKERS * 4))), ZIP_BATCH_MAX)
+    tasks = [
+        asyncio.create_task(_convert_zip_batch(temp_zip, names[i:i + batch]))
+        for i in range(0, len(names), batch)
+    ]
+    # Remove o ZIP quando todas as entradas terminarem
+    _release_when_done(staged, tasks)
+    return StreamingResponse(_iter_ndjson(tasks), media_type="application/x-ndjson")
 
 # ----------------------------------------------------------------------------
 # Execução local (opcional)
@@ -329,4 +716,15 @@ async def convert_zip(file: UploadFile = File(...)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("api_markitdown:app", host="0.0.0.0", port=8002, reload=True)
+
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # Os workers herdam o valor e dividem os núcleos entre seus pools
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "api_markitdown:app",
+        host="0.0.0.0",
+        port=8002,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+    )
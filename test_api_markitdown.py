@@ -0,0 +1,41 @@
+import asyncio
+import zlib
+
+from starlette.middleware.gzip import GZipMiddleware
+
+import api_markitdown
+
+LINES = [b'{"filename": "a.csv", "markdown": "x"}\n', b'{"filename": "b.csv", "markdown": "y"}\n']
+
+
+def _app_gzip(inner):
+    """Envolve `inner` com o GZipMiddleware configurado na API."""
+    (mw,) = [m for m in api_markitdown.app.user_middleware if m.cls is GZipMiddleware]
+    return GZipMiddleware(inner, *mw.args, **mw.kwargs)
+
+
+async def _ndjson_app(scope, receive, send):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    })
+    for line in LINES:
+        await send({"type": "http.response.body", "body": line, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def test_gzip_flushes_each_ndjson_line():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(_app_gzip(_ndjson_app)(scope, None, send))
+
+    start, *bodies = sent
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    # Cada bloco comprimido já decodifica a linha inteira, sem esperar o fim do stream
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert [decoder.decompress(m["body"]) for m in bodies] == LINES + [b""]